@@ -1,43 +1,169 @@
+import contextlib
+import functools
+import hashlib
+import io
 import os
+import numpy as np
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pcsv
 import re
 import subprocess
 import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Request, render_template, request, jsonify, send_file, send_from_directory, url_for
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 import json
+import mimetypes
 import requests
+from requests.adapters import HTTPAdapter
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        """Spool uploaded videos and CSVs straight into the upload folder
+        
+        save_upload can then hard link the spooled file into place instead
+        of copying the whole video a second time, and CSVs can be memory
+        mapped instead of read through the spooled stream.
+        """
+        if self.endpoint in ('upload_video', 'upload_csv'):
+            return tempfile.NamedTemporaryFile('wb+', dir=app.config['UPLOAD_FOLDER'], prefix='.upload_')
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider using orjson, which is much faster on large segment lists"""
+    
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+app.request_class = UploadRequest
+app.json = OrjsonProvider(app)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024 * 1024  # 1GB max file size
 
+# Internal nginx location serving UPLOAD_FOLDER (e.g. /protected/). When set,
+# uploaded files are handed to nginx with X-Accel-Redirect instead of being
+# streamed through Python.
+app.config['X_ACCEL_REDIRECT_PREFIX'] = os.environ.get('X_ACCEL_REDIRECT_PREFIX')
+
 # ElevenLabs API configuration
 ELEVENLABS_API_KEY = os.environ.get('ELEVENLABS_API_KEY')
 ELEVENLABS_BASE_URL = 'https://api.elevenlabs.io/v1'
+ELEVENLABS_TIMEOUT = (3, 10)  # (connect, read) seconds
+ELEVENLABS_VOICES_TTL = 300  # seconds
 
-# Ensure upload directory exists
+# Keep connections to the ElevenLabs API alive between requests
+elevenlabs_session = requests.Session()
+elevenlabs_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# Voices rarely change, so cache them per API key as (fetched_at, voices)
+voices_cache = {}
+
+# Conversion job status files, shared by all worker processes
+CONVERSION_JOBS_FOLDER = os.path.join(app.config['UPLOAD_FOLDER'], '.jobs')
+
+# Ensure upload directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(CONVERSION_JOBS_FOLDER, exist_ok=True)
+
+# Video conversions run in the background. ffmpeg does the work in its own
+# process, so pool threads only wait on it; the number of queued jobs is capped.
+# Each gunicorn worker process has its own pool, so by default each converts
+# one video at a time.
+CONVERSION_WORKERS = int(os.environ.get('CONVERSION_WORKERS', 1))
+MAX_PENDING_CONVERSIONS = CONVERSION_WORKERS * 4
+conversion_executor = ThreadPoolExecutor(max_workers=CONVERSION_WORKERS, thread_name_prefix='convert')
+conversion_slots = threading.BoundedSemaphore(MAX_PENDING_CONVERSIONS)
+
+# Previews are cached by content hash so identical uploads skip ffmpeg.
+# Unused previews expire after a week, and the least recently used ones are
+# evicted once the cache grows past PREVIEW_CACHE_MAX_BYTES.
+PREVIEW_CACHE_TTL = 7 * 24 * 3600  # seconds
+PREVIEW_CACHE_MAX_BYTES = int(os.environ.get('PREVIEW_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))  # 2GB
+STALE_CONVERSION_AGE = 3600  # seconds before a 'processing' job is presumed lost
+
+# Render node used for VAAPI (Intel/AMD) hardware encoding
+VAAPI_DEVICE = '/dev/dri/renderD128'
+
+# Preview encoding quality: constant quality, with the bitrate capped for
+# busy scenes so previews stay small. VAAPI's QVBR mode also needs an
+# average bitrate to aim for
+PREVIEW_QUALITY = '23'
+PREVIEW_TARGET_BITRATE = '600k'
+PREVIEW_MAX_BITRATE = '800k'
+PREVIEW_BUFFER_SIZE = '1600k'
+
+# Previews are scaled down to at most 480p, keeping the aspect ratio and
+# even dimensions (required for H.264). ffmpeg evaluates this against the
+# input when building the filter graph, so the video needn't be probed first
+PREVIEW_SCALE = "w=-2:h='min(480,trunc(ih/2)*2)'"
 
 # Allowed video file extensions
 ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm', 'flv'}
 
+# Timecode formats: hh:mm:ss, hh:mm:ss.000 and hh:mm:ss:ff, or decimal seconds
+TIMECODE_PATTERN = (
+    r'^(?P<hours>[+-]?\d+)\s*:\s*(?P<minutes>[+-]?\d+)\s*:\s*(?P<seconds>[+-]?\d+)'
+    r'(?:(?P<fraction>\.\d*)|\s*:\s*(?P<frames>[+-]?\d+))?$'
+)
+DECIMAL_SECONDS_PATTERN = r'^[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?$'
+
+# Latest time a segment may end at; format_timecodes counts milliseconds in
+# int64, which overflows a little above 9.2e15 seconds
+MAX_TIMECODE_SECONDS = 1e15
+
+# Block size for Arrow's streaming CSV reader, and rows per chunk when
+# falling back to pandas
+CSV_BLOCK_SIZE = 8 << 20  # 8MB
+CSV_CHUNK_ROWS = 100_000
+
+# Column delimiters recognised in the header of an uploaded CSV, and how
+# much of the upload to read looking for it
+CSV_DELIMITERS = (',', ';', '\t')
+CSV_SNIFF_BYTES = 4096
+
+# Column names containing any of these are taken as the source text
+SOURCE_KEYWORDS = frozenset(['script', 'line', 'text', 'transcription'])
+
 def allowed_video_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_VIDEO_EXTENSIONS
+    return os.path.splitext(filename)[1][1:].lower() in ALLOWED_VIDEO_EXTENSIONS
 
 def get_elevenlabs_voices():
     """Fetch available voices from ElevenLabs API"""
     if not ELEVENLABS_API_KEY:
         return []
     
+    cached = voices_cache.get(ELEVENLABS_API_KEY)
+    if cached and time.monotonic() - cached[0] < ELEVENLABS_VOICES_TTL:
+        return cached[1]
+    
     try:
         headers = {
             'xi-api-key': ELEVENLABS_API_KEY
         }
         
-        response = requests.get(f'{ELEVENLABS_BASE_URL}/voices', headers=headers)
+        response = elevenlabs_session.get(
+            f'{ELEVENLABS_BASE_URL}/voices',
+            headers=headers,
+            timeout=ELEVENLABS_TIMEOUT
+        )
         
         if response.status_code == 200:
             voices_data = response.json()
@@ -52,6 +178,7 @@ def get_elevenlabs_voices():
                     'labels': voice.get('labels', {})
                 })
             
+            voices_cache[ELEVENLABS_API_KEY] = (time.monotonic(), voices)
             return voices
         else:
             app.logger.error(f'ElevenLabs API error: {response.status_code} - {response.text}')
@@ -61,146 +188,284 @@ def get_elevenlabs_voices():
         app.logger.error(f'Error fetching ElevenLabs voices: {str(e)}')
         return []
 
-def parse_timecode(time_str):
-    """Parse timecode in format hh:mm:ss:ff, hh:mm:ss.000, or decimal seconds
+def _to_seconds(values):
+    """Cast an Arrow string array of numbers to a float array, treating '' as 0"""
+    return pc.cast(pc.if_else(pc.equal(values, ''), '0', values), pa.float64()).to_numpy(zero_copy_only=False)
+
+def parse_timecodes(values):
+    """Parse a whole Arrow string column of timecodes into seconds
     
     Supported formats:
     - 00.167 (decimal seconds)
     - 00:00:00 (hours:minutes:seconds)
     - 00:00:00:00 (hours:minutes:seconds:frames)
     - 00:00:00.000 (hours:minutes:seconds.milliseconds)
+    
+    Returns a float array. Values that fail to parse become 0, while empty
+    cells stay NaN so that the segment filter drops them.
     """
-    # Convert to string and strip whitespace
-    time_str = str(time_str).strip()
+    time_strs = pc.utf8_trim_whitespace(values)
     
-    # Handle different timecode formats
-    if ':' in time_str:
-        parts = time_str.split(':')
-        if len(parts) == 4:  # hh:mm:ss:ff format
-            try:
-                hours, minutes, seconds, frames = map(int, parts)
-                total_seconds = hours * 3600 + minutes * 60 + seconds + frames / 30.0
-            except (ValueError, TypeError):
-                return 0
-        elif len(parts) == 3:  # hh:mm:ss or hh:mm:ss.000 format
-            try:
-                hours, minutes = map(int, parts[:2])
-                seconds_part = parts[2]
-                
-                # Check if seconds part contains milliseconds
-                if '.' in seconds_part:
-                    seconds, milliseconds = seconds_part.split('.')
-                    seconds = int(seconds)
-                    milliseconds = float('0.' + milliseconds)
-                    total_seconds = hours * 3600 + minutes * 60 + seconds + milliseconds
-                else:
-                    seconds = int(seconds_part)
-                    total_seconds = hours * 3600 + minutes * 60 + seconds
-            except (ValueError, TypeError):
-                return 0
-        else:
-            return 0
-    else:
-        # Try to parse as decimal seconds
-        try:
-            total_seconds = float(time_str)
-        except (ValueError, TypeError):
-            return 0
+    # hh:mm:ss, hh:mm:ss.000 and hh:mm:ss:ff
+    fields = pc.extract_regex(time_strs, TIMECODE_PATTERN)
+    fraction = pc.binary_join_element_wise('0', pc.struct_field(fields, 'fraction'), '')
+    timecode_seconds = (
+        _to_seconds(pc.struct_field(fields, 'hours')) * 3600 +
+        _to_seconds(pc.struct_field(fields, 'minutes')) * 60 +
+        _to_seconds(pc.struct_field(fields, 'seconds')) +
+        _to_seconds(fraction) +
+        _to_seconds(pc.struct_field(fields, 'frames')) / 30.0
+    )
     
-    return total_seconds
+    # Decimal seconds
+    is_decimal = pc.fill_null(pc.match_substring_regex(time_strs, DECIMAL_SECONDS_PATTERN), False)
+    decimal_seconds = _to_seconds(pc.if_else(is_decimal, time_strs, '0'))
+    
+    total_seconds = np.where(
+        pc.fill_null(pc.is_valid(fields), False).to_numpy(zero_copy_only=False),
+        timecode_seconds,
+        decimal_seconds
+    )
+    return np.where(pc.is_null(values).to_numpy(zero_copy_only=False), np.nan, total_seconds)
 
-def format_timecode(seconds):
-    """Format seconds to hh:mm:ss.000 format"""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = seconds % 60
-    return f"{hours:02d}:{minutes:02d}:{secs:06.3f}"
+def _zero_pad(values, width):
+    """Format an integer array as an Arrow string array, zero padded to width"""
+    return pc.utf8_lpad(pc.cast(pa.array(values), pa.string()), width, padding='0')
 
+def format_timecodes(seconds):
+    """Format a float array of seconds as hh:mm:ss.000 strings"""
+    total_ms = np.round(np.asarray(seconds, dtype=float) * 1000).astype(np.int64)
+    total_secs, millis = np.divmod(total_ms, 1000)
+    total_minutes, secs = np.divmod(total_secs, 60)
+    hours, minutes = np.divmod(total_minutes, 60)
+    
+    secs_and_millis = pc.binary_join_element_wise(_zero_pad(secs, 2), _zero_pad(millis, 3), '.')
+    timecodes = pc.binary_join_element_wise(_zero_pad(hours, 2), _zero_pad(minutes, 2), secs_and_millis, ':')
+    return timecodes.to_numpy(zero_copy_only=False)
+
+@functools.lru_cache(maxsize=256)
 def normalize_column_name(column_name):
     """Normalize column names to handle case-insensitive matching"""
     return column_name.lower().strip()
 
-def find_source_column(df):
-    """Find the source column (script, line, text, transcription) in the CSV"""
-    source_keywords = ['script', 'line', 'text', 'transcription']
+def find_source_column(normalized_columns):
+    """Find the source column (script, line, text, transcription) in the CSV
     
-    for col in df.columns:
-        normalized_col = normalize_column_name(col)
-        if any(keyword in normalized_col for keyword in source_keywords):
+    Takes a mapping of normalized column names to the original names.
+    """
+    for normalized_col, col in normalized_columns.items():
+        if any(keyword in normalized_col for keyword in SOURCE_KEYWORDS):
             return col
     
     return None
 
-def convert_video_for_preview(input_path, output_path):
-    """Convert video to MP4 format suitable for web preview"""
+def sniff_csv_delimiter(stream):
+    """Pick the most frequent of CSV_DELIMITERS in the header line, or None if it has none"""
+    head = stream.read(CSV_SNIFF_BYTES)
+    stream.seek(0)
+    
+    newline = head.find(b'\n')
+    header = head[:newline] if newline >= 0 else head
+    counts = {delimiter: header.count(delimiter.encode()) for delimiter in CSV_DELIMITERS}
+    delimiter = max(counts, key=counts.get)
+    return delimiter if counts[delimiter] else None
+
+def read_csv_columns(stream, delimiter):
+    """Read the stripped column names from the header of an uploaded CSV"""
+    column_names = [str(col).strip() for col in pd.read_csv(stream, sep=delimiter, nrows=0).columns]
+    stream.seek(0)
+    return column_names
+
+def spooled_upload_path(file):
+    """Path of the temporary file an upload was spooled to, or None if it is in memory"""
+    path = getattr(file.stream, 'name', None)
+    return path if isinstance(path, str) else None
+
+def iter_csv_batches(source, column_names, delimiter):
+    """Stream an uploaded CSV as Arrow record batches with every column as strings
+    
+    Uses Arrow's multi-threaded streaming CSV reader so only one block of rows
+    is held in memory at a time. Input Arrow cannot parse, such as ragged
+    rows, is read with pandas in chunks instead, resuming after the rows
+    Arrow already produced. A source given as a path is memory mapped rather
+    than copied through a file object.
+    """
+    rows_read = 0
+    is_path = isinstance(source, str)
+    
     try:
-        # Get video info
-        probe_cmd = [
-            'ffprobe', '-v', 'quiet', '-print_format', 'json',
-            '-show_format', '-show_streams', input_path
-        ]
-        
-        result = subprocess.run(probe_cmd, capture_output=True, text=True, timeout=30)
-        if result.returncode != 0:
-            return False, "Failed to probe video file"
-        
-        # Parse video info
-        video_info = json.loads(result.stdout)
-        
-        # Find video stream
-        video_stream = None
-        for stream in video_info.get('streams', []):
-            if stream.get('codec_type') == 'video':
-                video_stream = stream
-                break
-        
-        if not video_stream:
-            return False, "No video stream found"
-        
-        # Get original dimensions
-        width = int(video_stream.get('width', 1920))
-        height = int(video_stream.get('height', 1080))
-        
-        app.logger.info(f"Original video dimensions: {width}x{height}")
-        
-        # For Render's limited resources, use more conservative settings
-        # Scale down more aggressively and use faster preset
-        if height > 480:  # Reduced from 720p to 480p
-            # Scale down to maximum 480p
-            scale_factor = 480 / height
-            new_width = int(width * scale_factor)
-            new_height = 480
-        else:
-            # Keep original size if already 480p or lower
-            new_width = width
-            new_height = height
-        
-        app.logger.info(f"Calculated dimensions: {new_width}x{new_height}")
-        
-        # Ensure dimensions are even numbers (required for H.264)
-        new_width = new_width + (new_width % 2)
-        new_height = new_height + (new_height % 2)
-        
-        # Use lower bitrate for smaller file size and faster processing
-        target_bitrate = "800k"  # Reduced from 1600k
+        with pa.memory_map(source) if is_path else contextlib.nullcontext(source) as stream:
+            reader = pcsv.open_csv(
+                stream,
+                read_options=pcsv.ReadOptions(
+                    use_threads=True,
+                    block_size=CSV_BLOCK_SIZE,
+                    skip_rows=1,
+                    column_names=column_names
+                ),
+                parse_options=pcsv.ParseOptions(delimiter=delimiter),
+                convert_options=pcsv.ConvertOptions(
+                    column_types=dict.fromkeys(column_names, pa.string()),
+                    strings_can_be_null=True
+                )
+            )
+            for batch in reader:
+                rows_read += batch.num_rows
+                yield batch
+    except pa.ArrowInvalid as e:
+        app.logger.info(f"Arrow CSV reader failed after {rows_read} rows, falling back to pandas: {str(e)}")
+        if not is_path:
+            source.seek(0)
+        chunks = pd.read_csv(
+            source,
+            sep=delimiter,
+            dtype=str,
+            header=0,
+            names=column_names,
+            skiprows=range(1, rows_read + 1),
+            chunksize=CSV_CHUNK_ROWS,
+            memory_map=is_path
+        )
+        # Keep every column as strings, even one that is all empty in a chunk
+        schema = pa.schema([(col, pa.string()) for col in column_names])
+        for chunk in chunks:
+            yield pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False)
+
+def build_timeline(batch, first_row, speaker_col, start_time_col, end_time_col, source_col):
+    """Build the valid segments of one batch of CSV rows as a DataFrame"""
+    start_times = parse_timecodes(batch[start_time_col])
+    end_times = parse_timecodes(batch[end_time_col])
+    # Exponents like 1e400 parse as infinity, which isn't a usable time
+    valid = (np.isfinite(start_times) & np.isfinite(end_times) & (start_times >= 0) &
+             (end_times > start_times) & (end_times <= MAX_TIMECODE_SECONDS))
+    
+    rows = batch.select([speaker_col, source_col]).filter(pa.array(valid))
+    timeline = pd.DataFrame({
+        'id': np.flatnonzero(valid) + first_row,
+        'speaker': pc.fill_null(rows[speaker_col], '').to_numpy(zero_copy_only=False),
+        'start_time': start_times[valid],
+        'end_time': end_times[valid],
+    })
+    timeline['start_time_formatted'] = format_timecodes(timeline['start_time'])
+    timeline['end_time_formatted'] = format_timecodes(timeline['end_time'])
+    timeline['text'] = pc.fill_null(rows[source_col], '').to_numpy(zero_copy_only=False)
+    timeline['duration'] = timeline['end_time'] - timeline['start_time']
+    return timeline
+
+def save_upload(file, path):
+    """Save an uploaded file, hard linking it when it was already spooled to disk"""
+    spooled_path = spooled_upload_path(file)
+    if spooled_path:
+        try:
+            os.link(spooled_path, path)
+            return
+        except OSError:
+            pass
+    
+    file.save(path)
+
+@functools.lru_cache(maxsize=None)
+def hardware_h264_encoder():
+    """Detect once which hardware H.264 encoder ffmpeg can use: 'nvenc', 'vaapi' or None"""
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    
+    # An encoder being built into ffmpeg does not mean the GPU is there,
+    # so check each one with a tiny test encode
+    test_input = ['-f', 'lavfi', '-i', 'color=size=256x256:duration=0.1']
+    candidates = [
+        ('nvenc', [*test_input, '-c:v', 'h264_nvenc']),
+        ('vaapi', ['-vaapi_device', VAAPI_DEVICE, *test_input, '-vf', 'format=nv12,hwupload', '-c:v', 'h264_vaapi']),
+    ]
+    
+    for encoder, test_args in candidates:
+        if f'h264_{encoder}' not in result.stdout:
+            continue
         
-        # Convert video with optimized settings for Render
-        convert_cmd = [
-            'ffmpeg', '-i', input_path,
+        # Test with the rate control real conversions use, which not every GPU supports
+        test_args = [*test_args, *rate_control_args(encoder)]
+        try:
+            test = subprocess.run(['ffmpeg', '-hide_banner', '-v', 'error', *test_args, '-f', 'null', '-'],
+                                  capture_output=True, timeout=30)
+        except (OSError, subprocess.SubprocessError):
+            continue
+        
+        if test.returncode == 0:
+            app.logger.info(f"Using hardware H.264 encoder: h264_{encoder}")
+            return encoder
+    
+    return None
+
+def rate_control_args(encoder=None):
+    """ffmpeg rate control arguments for encoding previews with the given hardware encoder, or libx264"""
+    if encoder == 'nvenc':
+        args = ['-rc', 'vbr', '-cq', PREVIEW_QUALITY, '-b:v', '0']
+    elif encoder == 'vaapi':
+        # QVBR is bitrate based, so ffmpeg rejects it without a target bitrate
+        args = ['-rc_mode', 'QVBR', '-global_quality', PREVIEW_QUALITY, '-b:v', PREVIEW_TARGET_BITRATE]
+    else:
+        args = ['-crf', PREVIEW_QUALITY]
+    
+    return [*args, '-maxrate', PREVIEW_MAX_BITRATE, '-bufsize', PREVIEW_BUFFER_SIZE]
+
+def build_convert_cmd(input_path, output_path, encoder=None):
+    """Build the ffmpeg command converting a video for preview with the given hardware encoder, or libx264"""
+    if encoder == 'nvenc':
+        # Decode, scale and encode entirely on the NVIDIA GPU
+        video_args = [
+            '-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda',
+            '-i', input_path,
+            '-c:v', 'h264_nvenc',
+            '-vf', f'scale_cuda={PREVIEW_SCALE}',
+            '-preset', 'p4',
+            '-tune', 'll',
+        ]
+    elif encoder == 'vaapi':
+        # Upload decoded frames to the Intel/AMD GPU for scaling and encoding
+        video_args = [
+            '-vaapi_device', VAAPI_DEVICE,
+            '-i', input_path,
+            '-c:v', 'h264_vaapi',
+            '-vf', f'format=nv12,hwupload,scale_vaapi={PREVIEW_SCALE}',
+        ]
+    else:
+        # Optimized settings for Render's CPUs
+        video_args = [
+            '-i', input_path,
             '-c:v', 'libx264',  # H.264 codec
-            '-c:a', 'aac',       # AAC audio codec
-            '-b:v', target_bitrate,
-            '-vf', f'scale={new_width}:{new_height}:flags=fast_bilinear',  # Use faster scaling
+            '-vf', f'scale={PREVIEW_SCALE}:flags=fast_bilinear',  # Use faster scaling
             '-preset', 'ultrafast',  # Use fastest preset for Render
             '-tune', 'fastdecode',   # Optimize for fast decoding
-            '-movflags', '+faststart',  # Optimize for web streaming
-            '-y',  # Overwrite output file
-            output_path
         ]
+    
+    return [
+        'ffmpeg', *video_args,
+        *rate_control_args(encoder),
+        '-map', '0:v:0', '-map', '0:a?',  # First video stream and any audio
+        '-c:a', 'aac',       # AAC audio codec
+        '-movflags', '+faststart',  # Optimize for web streaming
+        '-y',  # Overwrite output file
+        output_path
+    ]
+
+def convert_video_for_preview(input_path, output_path):
+    """Convert video to MP4 format suitable for web preview"""
+    try:
+        # Encode on the GPU when one is available, otherwise on the CPU
+        encoder = hardware_h264_encoder()
+        convert_cmd = build_convert_cmd(input_path, output_path, encoder)
         
         # Add timeout to prevent hanging
         result = subprocess.run(convert_cmd, capture_output=True, text=True, timeout=300)  # 5 minute timeout
         
+        if result.returncode != 0 and encoder:
+            # The GPU may not support this input (e.g. its codec or pixel format)
+            app.logger.warning(f"{encoder} conversion failed, retrying with libx264: {result.stderr[-500:]}")
+            convert_cmd = build_convert_cmd(input_path, output_path)
+            result = subprocess.run(convert_cmd, capture_output=True, text=True, timeout=300)
+        
         if result.returncode != 0:
             app.logger.error(f"FFmpeg conversion failed with return code {result.returncode}")
             app.logger.error(f"FFmpeg stderr: {result.stderr}")
@@ -209,7 +474,6 @@ def convert_video_for_preview(input_path, output_path):
             return False, f"FFmpeg conversion failed: {result.stderr}"
         
         app.logger.info(f"Video conversion successful: {input_path} -> {output_path}")
-        app.logger.info(f"Output dimensions: {new_width}x{new_height}")
         return True, "Video converted successfully"
         
     except subprocess.TimeoutExpired:
@@ -217,6 +481,143 @@ def convert_video_for_preview(input_path, output_path):
     except Exception as e:
         return False, f"Video conversion error: {str(e)}"
 
+def write_conversion_status(job_id, status):
+    """Record the status of a conversion job where every worker process can read it"""
+    status_path = os.path.join(CONVERSION_JOBS_FOLDER, f'{job_id}.json')
+    with open(f'{status_path}.tmp', 'w') as f:
+        json.dump({**status, 'updated_at': time.time()}, f)
+    os.replace(f'{status_path}.tmp', status_path)
+
+def read_conversion_status(job_id):
+    """Read the status of a conversion job, or None if the job is unknown
+    
+    A job still processing after STALE_CONVERSION_AGE was lost, e.g. with a
+    worker that was restarted, and is reported as failed.
+    """
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return None
+    
+    try:
+        with open(os.path.join(CONVERSION_JOBS_FOLDER, f'{job_id}.json')) as f:
+            status = json.load(f)
+    except FileNotFoundError:
+        return None
+    
+    if status['status'] == 'processing' and time.time() - status['updated_at'] > STALE_CONVERSION_AGE:
+        return {'status': 'failed', 'error': 'Video conversion was interrupted, please upload the video again',
+                'updated_at': status['updated_at']}
+    return status
+
+def video_content_key(path):
+    """Hash a video's contents into the key identifying its cached preview"""
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()[:32]
+
+def prune_preview_cache():
+    """Delete expired previews, then the least recently used ones over the size limit
+    
+    Uploads and partial previews left behind by lost conversion jobs are
+    deleted too, as are the statuses of old jobs that never produced a
+    preview.
+    """
+    now = time.time()
+    previews = []
+    for entry in os.scandir(app.config['UPLOAD_FOLDER']):
+        if not entry.is_file():
+            continue
+        
+        stat = entry.stat()
+        if entry.name.startswith('preview_'):
+            previews.append((stat.st_mtime, stat.st_size, entry.name))
+        elif entry.name.startswith(('original_', '.converting_', '.upload_')) and now - stat.st_mtime > STALE_CONVERSION_AGE:
+            try:
+                os.remove(entry.path)
+                app.logger.info(f"Removed file left by a lost conversion: {entry.name}")
+            except FileNotFoundError:
+                pass
+    
+    kept_bytes = 0
+    
+    # Most recently used first
+    for mtime, size, name in sorted(previews, reverse=True):
+        if now - mtime < PREVIEW_CACHE_TTL and kept_bytes + size <= PREVIEW_CACHE_MAX_BYTES:
+            kept_bytes += size
+            continue
+        
+        job_id = name[len('preview_'):].rsplit('.', 1)[0]
+        for path in (os.path.join(app.config['UPLOAD_FOLDER'], name),
+                     os.path.join(CONVERSION_JOBS_FOLDER, f'{job_id}.json')):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        app.logger.info(f"Evicted cached preview: {name}")
+    
+    # Failed jobs, including lost ones now reported as failed, have no preview
+    # whose eviction would remove their status
+    for entry in os.scandir(CONVERSION_JOBS_FOLDER):
+        job_id, ext = os.path.splitext(entry.name)
+        if ext != '.json' or now - entry.stat().st_mtime < PREVIEW_CACHE_TTL:
+            continue
+        if os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], f'preview_{job_id}.mp4')):
+            continue
+        
+        status = read_conversion_status(job_id)
+        if status and status['status'] != 'processing':
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            app.logger.info(f"Removed status of old conversion job: {job_id}")
+
+def run_video_conversion(job_id, original_filepath, preview_filepath, file_size_mb):
+    """Convert an uploaded video for preview in the background and record the outcome"""
+    preview_filename = os.path.basename(preview_filepath)
+    
+    # Convert under a temporary name so a preview only appears once complete
+    converting_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f".converting_{uuid.uuid4().hex}.mp4")
+    
+    try:
+        app.logger.info(f"Starting video conversion: {original_filepath} -> {preview_filepath}")
+        success, message = convert_video_for_preview(original_filepath, converting_filepath)
+        
+        if success:
+            os.replace(converting_filepath, preview_filepath)
+        else:
+            app.logger.error(f"Video conversion failed: {message}")
+            if os.path.exists(converting_filepath):
+                os.remove(converting_filepath)
+            
+            # For large files, try to use the original file without conversion
+            if file_size_mb > 50:
+                app.logger.info("Large file detected, attempting to use original file without conversion")
+                try:
+                    os.replace(original_filepath, preview_filepath)
+                    app.logger.info("Using original file without conversion")
+                    success = True
+                    message = "Using original file (conversion skipped for large file)"
+                except Exception as e:
+                    app.logger.error(f"Failed to move original file: {str(e)}")
+        
+        if success:
+            app.logger.info(f"Video upload successful: {preview_filename}")
+            write_conversion_status(job_id, {'status': 'done', 'filename': preview_filename, 'message': message})
+            prune_preview_cache()
+        else:
+            write_conversion_status(job_id, {'status': 'failed', 'error': f'Video conversion failed: {message}'})
+    
+    except Exception as e:
+        app.logger.error(f'Video conversion job {job_id} error: {str(e)}')
+        write_conversion_status(job_id, {'status': 'failed', 'error': f'Error converting video: {str(e)}'})
+    
+    finally:
+        conversion_slots.release()
+        
+        # Clean up original file to save space
+        if os.path.exists(original_filepath):
+            os.remove(original_filepath)
+            app.logger.info("Original file cleaned up")
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -246,35 +647,24 @@ def upload_csv():
     if file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
     
-    # Validate file extension
-    if not file.filename.lower().endswith('.csv'):
-        return jsonify({'error': 'Please upload a CSV file. Only .csv files are allowed.'}), 400
+    # Check the upload looks like a CSV rather than trusting its filename or
+    # content type (Windows browsers send CSVs as application/vnd.ms-excel)
+    delimiter = sniff_csv_delimiter(file.stream)
+    if not delimiter:
+        return jsonify({'error': 'Please upload a CSV file with comma, semicolon or tab separated columns.'}), 400
     
     try:
-        # Read CSV file
-        df = pd.read_csv(file)
-        
-        # Normalize column names for case-insensitive matching
-        df.columns = [col.strip() for col in df.columns]
+        # Read CSV header
+        column_names = read_csv_columns(file.stream, delimiter)
         
         # Find required columns
-        speaker_col = None
-        start_time_col = None
-        end_time_col = None
-        source_col = None
-        
-        for col in df.columns:
-            normalized_col = normalize_column_name(col)
-            
-            if normalized_col in ['speaker']:
-                speaker_col = col
-            elif normalized_col in ['start_time', 'starttime', 'start time']:
-                start_time_col = col
-            elif normalized_col in ['end_time', 'endtime', 'end time']:
-                end_time_col = col
-        
-        # Find source column
-        source_col = find_source_column(df)
+        normalized_columns = {normalize_column_name(col): col for col in column_names}
+        speaker_col = normalized_columns.get('speaker')
+        start_time_col = (normalized_columns.get('start_time') or normalized_columns.get('starttime')
+                          or normalized_columns.get('start time'))
+        end_time_col = (normalized_columns.get('end_time') or normalized_columns.get('endtime')
+                        or normalized_columns.get('end time'))
+        source_col = find_source_column(normalized_columns)
         
         if not speaker_col or not start_time_col or not end_time_col or not source_col:
             missing_cols = []
@@ -291,41 +681,30 @@ def upload_csv():
                 'error': f'Missing required columns: {", ".join(missing_cols)}'
             }), 400
         
-        # Parse timecodes and create segments
-        segments = []
-        speakers = set()
+        # Parse timecodes and create segments, one batch of rows at a time
+        timelines = []
+        first_row = 0
         
-        for index, row in df.iterrows():
-            try:
-                start_time = parse_timecode(str(row[start_time_col]))
-                end_time = parse_timecode(str(row[end_time_col]))
-                speaker = str(row[speaker_col])
-                text = str(row[source_col])
-            except Exception as e:
-                app.logger.error(f"Error processing row {index}: {e}")
-                app.logger.error(f"Row data: {row.to_dict()}")
-                continue
-            
-            if start_time >= 0 and end_time > start_time:
-                segments.append({
-                    'id': index,
-                    'speaker': speaker,
-                    'start_time': start_time,
-                    'end_time': end_time,
-                    'start_time_formatted': format_timecode(start_time),
-                    'end_time_formatted': format_timecode(end_time),
-                    'text': text,
-                    'duration': end_time - start_time
-                })
-                speakers.add(speaker)
+        for batch in iter_csv_batches(spooled_upload_path(file) or file.stream, column_names, delimiter):
+            timelines.append(build_timeline(batch, first_row, speaker_col, start_time_col, end_time_col, source_col))
+            first_row += batch.num_rows
+        
+        if timelines:
+            timeline = pd.concat(timelines, ignore_index=True)
+        else:
+            timeline = pd.DataFrame({'speaker': [], 'start_time': [], 'end_time': []})
+        
+        speakers = timeline['speaker'].unique().tolist()
         
         # Sort segments by start time
-        segments.sort(key=lambda x: x['start_time'])
+        timeline = timeline.sort_values('start_time', kind='stable')
+        segments = timeline.to_dict('records')
+        total_duration = float(timeline['end_time'].to_numpy().max(initial=0.0))
         
         return jsonify({
             'segments': segments,
-            'speakers': list(speakers),
-            'total_duration': max([seg['end_time'] for seg in segments]) if segments else 0
+            'speakers': speakers,
+            'total_duration': total_duration
         })
         
     except Exception as e:
@@ -371,61 +750,70 @@ def upload_video():
             app.logger.error(f"Failed to create upload directory: {str(e)}")
             return jsonify({'error': f'Failed to create upload directory: {str(e)}'}), 500
         
+        if not conversion_slots.acquire(blocking=False):
+            app.logger.error("Too many pending video conversions")
+            return jsonify({'error': 'Too many videos are being converted right now. Please try again shortly.'}), 503
+        
         # Save original file with temporary name
         original_filename = secure_filename(file.filename)
-        original_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"original_{original_filename}")
+        original_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"original_{uuid.uuid4().hex}_{original_filename}")
         
         try:
-            file.save(original_filepath)
+            save_upload(file, original_filepath)
             app.logger.info(f"Original file saved: {original_filepath}")
         except Exception as e:
+            conversion_slots.release()
             app.logger.error(f"Failed to save original file: {str(e)}")
             return jsonify({'error': f'Failed to save video file: {str(e)}'}), 500
         
         # Verify original file was saved
         if not os.path.exists(original_filepath):
+            conversion_slots.release()
             app.logger.error(f"Original file not found after save: {original_filepath}")
             return jsonify({'error': 'Failed to save original video file'}), 500
         
-        # Convert video for preview
-        preview_filename = f"preview_{original_filename.rsplit('.', 1)[0]}.mp4"
-        preview_filepath = os.path.join(app.config['UPLOAD_FOLDER'], preview_filename)
+        # Identical uploads share one conversion job and preview
+        try:
+            job_id = video_content_key(original_filepath)
+        except Exception:
+            conversion_slots.release()
+            os.remove(original_filepath)
+            raise
         
-        app.logger.info(f"Starting video conversion: {original_filepath} -> {preview_filepath}")
-        success, message = convert_video_for_preview(original_filepath, preview_filepath)
+        preview_filename = f"preview_{job_id}.mp4"
+        preview_filepath = os.path.join(app.config['UPLOAD_FOLDER'], preview_filename)
+        status = read_conversion_status(job_id)
         
-        if not success:
-            app.logger.error(f"Video conversion failed: {message}")
+        if os.path.exists(preview_filepath) or (status and status['status'] == 'processing'):
+            conversion_slots.release()
+            os.remove(original_filepath)
             
-            # For large files, try to use the original file without conversion
-            if file_size_mb > 50:
-                app.logger.info("Large file detected, attempting to use original file without conversion")
-                try:
-                    # Copy original file to preview location
-                    import shutil
-                    shutil.copy2(original_filepath, preview_filepath)
-                    app.logger.info("Using original file without conversion")
-                    success = True
-                    message = "Using original file (conversion skipped for large file)"
-                except Exception as e:
-                    app.logger.error(f"Failed to copy original file: {str(e)}")
+            if os.path.exists(preview_filepath):
+                app.logger.info(f"Using cached preview: {preview_filename}")
+                os.utime(preview_filepath)  # Mark as recently used
+                write_conversion_status(job_id, {'status': 'done', 'filename': preview_filename, 'message': 'Using cached preview'})
+            else:
+                app.logger.info(f"Video is already being converted: job {job_id}")
             
-            if not success:
-                # Clean up original file
-                if os.path.exists(original_filepath):
-                    os.remove(original_filepath)
-                return jsonify({'error': f'Video conversion failed: {message}'}), 400
+            return jsonify({
+                'job_id': job_id,
+                'status_url': url_for('video_status', job_id=job_id)
+            }), 202
         
-        # Clean up original file to save space
-        if os.path.exists(original_filepath):
+        # Convert video for preview in the background
+        try:
+            write_conversion_status(job_id, {'status': 'processing'})
+            conversion_executor.submit(run_video_conversion, job_id, original_filepath, preview_filepath, file_size_mb)
+        except Exception:
+            conversion_slots.release()
             os.remove(original_filepath)
-            app.logger.info("Original file cleaned up")
+            raise
         
-        app.logger.info(f"Video upload successful: {preview_filename}")
+        app.logger.info(f"Video conversion queued: job {job_id}")
         return jsonify({
-            'filename': preview_filename,
-            'filepath': preview_filepath
-        })
+            'job_id': job_id,
+            'status_url': url_for('video_status', job_id=job_id)
+        }), 202
         
     except Exception as e:
         app.logger.error(f'Video upload error: {str(e)}')
@@ -434,6 +822,14 @@ def upload_video():
         app.logger.error(f'Traceback: {traceback.format_exc()}')
         return jsonify({'error': f'Error uploading video: {str(e)}'}), 400
 
+@app.route('/video-status/<job_id>')
+def video_status(job_id):
+    """Get the status of a background video conversion"""
+    status = read_conversion_status(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown video conversion job'}), 404
+    return jsonify(status)
+
 @app.route('/export-csv', methods=['POST'])
 def export_csv():
     try:
@@ -468,18 +864,29 @@ def export_csv():
         
         df = pd.DataFrame(df_data)
         
-        # Save to temporary file
-        output_path = os.path.join(app.config['UPLOAD_FOLDER'], 'exported_script.csv')
-        df.to_csv(output_path, index=False)
+        # Write CSV in memory so concurrent exports never share a file
+        output = io.BytesIO()
+        df.to_csv(output, index=False)
+        output.seek(0)
         
-        return send_file(output_path, as_attachment=True, download_name='script_timeline.csv')
+        return send_file(output, mimetype='text/csv', as_attachment=True, download_name='script_timeline.csv')
         
     except Exception as e:
         return jsonify({'error': f'Error exporting CSV: {str(e)}'}), 400
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_file(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+    accel_prefix = app.config['X_ACCEL_REDIRECT_PREFIX']
+    if accel_prefix:
+        if safe_join(app.config['UPLOAD_FOLDER'], filename) is None:
+            return jsonify({'error': 'File not found'}), 404
+        
+        # Let nginx send the file itself, with Range support and sendfile
+        response = app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{filename}"
+        return response
+    
+    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, conditional=True)
 
 @app.errorhandler(Exception)
 def handle_exception(e):
@@ -0,0 +1,16 @@
+import os
+
+# Gunicorn configuration, picked up automatically by `gunicorn app:app`
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+
+# Run a couple of workers (WEB_CONCURRENCY overrides this), each serving many
+# clients at once with gevent so that one slow upload or ffmpeg run doesn't
+# block everyone else. The default is fixed rather than per core because the
+# core count seen in a container is the host's, not the container's quota
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gevent'
+worker_connections = 1000
+
+# Allow time for large uploads and CSV processing
+timeout = 300